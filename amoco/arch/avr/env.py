@@ -4,6 +4,8 @@
 # Copyright (C) 2014 Axel Tillequin (bdcht3@gmail.com)
 # published under GPLv2 license
 
+from types import MappingProxyType
+
 # import expressions:
 from amoco.cas.expressions import reg, slc, ext
 from amoco.cas.expressions import is_reg_flags, is_reg_pc, is_reg_stack
@@ -14,17 +16,22 @@ from amoco.cas.expressions import *  # noqa: F403
 # -----------
 
 # main reg set:
-R = [reg("R%d" % r, 8) for r in range(32)]
-
 X = reg("X", 16)
-R[26] = slc(X, 0, 8, "XL")
-R[27] = slc(X, 8, 8, "XH")
 Y = reg("Y", 16)
-R[28] = slc(Y, 0, 8, "YL")
-R[29] = slc(Y, 8, 8, "YH")
 Z = reg("Z", 16)
-R[30] = slc(Z, 0, 8, "ZL")
-R[31] = slc(Z, 8, 8, "ZH")
+# R26...R31 are the low/high bytes of the X, Y, Z pointers:
+_XYZ = {
+    26: (X, "XL"),
+    27: (X, "XH"),
+    28: (Y, "YL"),
+    29: (Y, "YH"),
+    30: (Z, "ZL"),
+    31: (Z, "ZH"),
+}
+R = [
+    slc(_XYZ[r][0], (r & 1) * 8, 8, _XYZ[r][1]) if r in _XYZ else reg("R%d" % r, 8)
+    for r in range(32)
+]
 
 with is_reg_flags:
     SREG = reg("SREG", 8)
@@ -53,7 +60,7 @@ EIND = reg("EIND", 8)
 
 registers = R + [sp, pc, SREG]
 
-mmregs = {
+_mmregs = {
     0x1E: reg("GPIOR0", 8),  # General Purpose I/O Register 0
     0x1F: reg(
         "EECR", 8
@@ -76,6 +83,7 @@ mmregs = {
     0x66: reg("OSCCAL", 8),  # Oscillator Calibration
     0xC6: reg("UDR0", 8),
 }
+mmregs = MappingProxyType(_mmregs)
 
 EECR = mmregs[0x1F]
 EERE = slc(EECR, 0, 1, "EERE")  # EEPROM Read Enable
@@ -85,7 +93,7 @@ EERIE = slc(EECR, 3, 1, "EERIE")  # enable EEPROM ready interrupt
 EEPM0 = slc(EECR, 4, 1, "EEPM0")  # EEPROM programming mode: 00=EraseWrite 01:EraseOnly
 EEPM1 = slc(EECR, 5, 1, "EEPM1")  #                          10=WriteOnly  11:Reserved
 
-vectors = [
+vectors = (
     ext("RESET", size=8),
     ext("INT0", size=8),
     ext("INT1", size=8),
@@ -112,6 +120,6 @@ vectors = [
     ext("ANALOG_COMP", size=8),
     ext("TWI", size=8),
     ext("SPM_READY", size=8),
-]
+)
 
 internals = {}
@@ -5,6 +5,8 @@
 # Copyright (C) 2013 Axel Tillequin (bdcht3@gmail.com)
 # published under GPLv2 license
 
+import os
+import re
 import pyparsing as pp
 
 from amoco.logger import Log
@@ -16,6 +18,30 @@ logger.debug("loading module")
 from amoco.arch.sparc.cpu_v8 import instruction_sparc as instruction
 from amoco.arch.sparc import env
 
+# register (and register slices) symbols that can be referenced as %name:
+_REG_TABLE = {
+    name: obj
+    for name, obj in env.__dict__.items()
+    if isinstance(obj, (env.reg, env.slc))
+}
+
+
+def _getreg(rname):
+    r = _REG_TABLE.get(rname)
+    if r is None:
+        if rname.startswith("asr"):
+            return env.reg(rname)
+        raise KeyError(rname)
+    return r
+
+
+# packrat memoization avoids re-parsing the same subterms when the infix
+# operators alternatives of exp are retried. It can be disabled by setting
+# AMOCO_PYPARSING_CACHE=0 in the environment (note that packrat is a global
+# pyparsing setting, not specific to this grammar.)
+if os.getenv("AMOCO_PYPARSING_CACHE", "1") != "0":
+    pp.ParserElement.enablePackrat(cache_size_limit=None)
+
 
 # ------------------------------------------------------------------------------
 # parser for sparc assembler syntax.
@@ -33,8 +59,9 @@ class sparc_syntax:
     hexa = pp.Regex(r"0[xX][0-9a-fA-F]+").setParseAction(lambda r: int(r[0], 16))
     octa = pp.Regex(r"0[0-7]*").setParseAction(lambda r: int(r[0], 8))
     bina = pp.Regex(r"0[bB][01]+").setParseAction(lambda r: int(r[0], 2))
-    char = pp.Regex(r"('.)|('\\\\)").setParseAction(lambda r: ord(r[0]))
-    number = integer | hexa | octa | bina | char
+    char = pp.Regex(r"('.)|('\\\\)").setParseAction(lambda r: ord(r[0][-1]))
+    # prefixed forms are tried first so that octa doesn't eat their leading 0:
+    number = hexa | bina | octa | integer | char
     number.setParseAction(lambda r: env.cst(r[0], 32))
 
     term = symbol | number
@@ -69,10 +96,7 @@ class sparc_syntax:
 
     @staticmethod
     def action_reg(toks):
-        rname = toks[0]
-        if rname.ref.startswith("asr"):
-            return env.reg(rname.ref)
-        return env.__dict__[rname.ref]
+        return _getreg(toks[0].ref)
 
     @staticmethod
     def action_hilo(toks):
@@ -117,6 +141,8 @@ class sparc_syntax:
     instr.setParseAction(action_instr)
 
 
+sparc_syntax.instr.streamline()
+
 from amoco.cas.expressions import cst, op
 from amoco.arch.sparc.spec_v8 import ISPECS
 from amoco.arch.sparc.formats import CONDB, CONDT
@@ -126,87 +152,325 @@ b_synonyms = {"b": "ba", "bgeu": "bcc", "blu": "bcs", "bz": "be", "bnz": "bne"}
 t_synonyms = {"t": "ta", "tgeu": "tcc", "tlu": "tcs", "tz": "te", "tnz": "tne"}
 b_cond = dict([(mn, cond) for cond, mn in CONDB.items()])
 t_cond = dict([(mn, cond) for cond, mn in CONDT.items()])
+r_index = dict([(r, idx) for idx, r in enumerate(env.r)])
 
 
-def asmhelper(i):
-    for idx, a in enumerate(i.operands):
-        if a._is_mem:
-            i.operands[idx] = a.a
-    # Add implicit arguments
-    if i.mnemonic in ["inc", "dec"] and len(i.operands) == 1:
-        i.operands.insert(0, cst(1))
-    # Expand reduced forms
-    if i.mnemonic == "bset":
-        i.mnemonic = "or"
-        i.operands.insert(0, i.operands[1])
-    elif i.mnemonic == "mov":
-        i.mnemonic = "or"
-        i.operands.insert(0, env.g0)
-    elif i.mnemonic == "retl":
-        i.mnemonic = "jmpl"
-        i.operands.insert(0, op("+", env.o7, cst(8)))
-        i.operands.insert(1, env.g0)
-    elif i.mnemonic == "jmp":
-        i.mnemonic = "jmpl"
-        i.operands.insert(1, env.g0)
-    elif i.mnemonic == "clr" and i.operands[0]._is_reg:
+# reduced forms expansion handlers, indexed by mnemonic:
+
+
+def _h_bset(i):
+    i.mnemonic = "or"
+    i.operands.insert(0, i.operands[1])
+
+
+def _h_mov(i):
+    i.mnemonic = "or"
+    i.operands.insert(0, env.g0)
+
+
+def _h_retl(i):
+    i.mnemonic = "jmpl"
+    i.operands.insert(0, op("+", env.o7, cst(8)))
+    i.operands.insert(1, env.g0)
+
+
+def _h_jmp(i):
+    i.mnemonic = "jmpl"
+    i.operands.insert(1, env.g0)
+
+
+def _h_clr(i):
+    if i.operands[0]._is_reg:
         i.mnemonic = "or"
         i.operands.insert(0, env.g0)
         i.operands.insert(0, env.g0)
-    elif i.mnemonic == "clr":
+    else:
         i.mnemonic = "st"
         i.operands.insert(0, env.g0)
-    elif i.mnemonic == "inc":
-        i.mnemonic = "add"
-        i.operands.insert(0, i.operands[1])
-    elif i.mnemonic == "dec":
-        i.mnemonic = "sub"
-        i.operands.insert(0, i.operands[1])
-    elif i.mnemonic == "cmp":
-        i.mnemonic = "subcc"
-        i.operands.insert(2, env.g0)
-    elif i.mnemonic == "btst":
-        i.mnemonic = "andcc"
-        i.operands.insert(2, env.g0)
-        i.operands[0:2] = [i.operands[1], i.operands[0]]
-    elif i.mnemonic == "nop":
-        i.mnemonic = "sethi"
-        i.operands = [cst(0, 22), env.g0]
-    elif i.mnemonic == "restore" and len(i.operands) == 0:
+
+
+def _h_inc(i):
+    if len(i.operands) == 1:
+        i.operands.insert(0, cst(1))
+    i.mnemonic = "add"
+    i.operands.insert(0, i.operands[1])
+
+
+def _h_dec(i):
+    if len(i.operands) == 1:
+        i.operands.insert(0, cst(1))
+    i.mnemonic = "sub"
+    i.operands.insert(0, i.operands[1])
+
+
+def _h_cmp(i):
+    i.mnemonic = "subcc"
+    i.operands.insert(2, env.g0)
+
+
+def _h_btst(i):
+    i.mnemonic = "andcc"
+    i.operands.insert(2, env.g0)
+    i.operands[0:2] = [i.operands[1], i.operands[0]]
+
+
+def _h_nop(i):
+    i.mnemonic = "sethi"
+    i.operands = [cst(0, 22), env.g0]
+
+
+def _h_restore(i):
+    if len(i.operands) == 0:
         i.operands = [env.g0, env.g0, env.g0]
+
+
+_MNEMO_HANDLERS = {
+    "bset": _h_bset,
+    "mov": _h_mov,
+    "retl": _h_retl,
+    "jmp": _h_jmp,
+    "clr": _h_clr,
+    "inc": _h_inc,
+    "dec": _h_dec,
+    "cmp": _h_cmp,
+    "btst": _h_btst,
+    "nop": _h_nop,
+    "restore": _h_restore,
+}
+
+# internal tweaks handlers, indexed by normalized mnemonic:
+
+
+def _p_call(i):
+    if len(i.operands) > 1 and i.operands[1] != cst(0):
+        raise ValueError("call has a non-zero second argument")
+    i.operands = [i.operands[0]]
+
+
+def _p_sethi(i):
+    if i.operands[0]._is_cst:
+        i.operands[0].size = 22
+
+
+def _p_std(i):
+    i.rd = r_index[i.operands[0]]
+
+
+def _p_ldd(i):
+    i.rd = r_index[i.operands[1]]
+
+
+_POST_HANDLERS = {
+    "call": _p_call,
+    "sethi": _p_sethi,
+    "std": _p_std,
+    "ldd": _p_ldd,
+}
+
+_CC_KEEP = frozenset(("taddcc", "tsubcc", "mulscc"))
+
+
+def _mnemo_decode(mnemonic):
+    # returns the normalized mnemonic, icc/annul flags, condition and spec
+    # of a (reduced-forms expanded) mnemonic string:
+    icc = annul = False
+    cond = None
+    if mnemonic.endswith("cc") and mnemonic not in _CC_KEEP:
+        mnemonic = mnemonic[:-2]
+        icc = True
+    mn, sep, a = mnemonic.rpartition(",")
+    if sep and a == "a":
+        annul = True
+        mnemonic = mn
+    mnemonic = b_synonyms.get(mnemonic, mnemonic)
+    c = b_cond.get(mnemonic)
+    if c is not None:
+        cond = c
+        mnemonic = "b"
+    mnemonic = t_synonyms.get(mnemonic, mnemonic)
+    c = t_cond.get(mnemonic)
+    if c is not None:
+        cond = c
+        mnemonic = "t"
+    return (mnemonic, icc, annul, cond, spec_table[mnemonic])
+
+
+# memoized results of _mnemo_decode:
+_MNEMO_CACHE = {}
+
+
+def asmhelper(i):
+    i.operands = [a.a if a._is_mem else a for a in i.operands]
+    # Expand reduced forms (and add implicit arguments)
+    h = _MNEMO_HANDLERS.get(i.mnemonic)
+    if h is not None:
+        h(i)
     # Branches and cc
-    if i.mnemonic.endswith("cc") and i.mnemonic not in ["taddcc", "tsubcc", "mulscc"]:
-        i.mnemonic = i.mnemonic[:-2]
+    r = _MNEMO_CACHE.get(i.mnemonic)
+    if r is None:
+        r = _MNEMO_CACHE[i.mnemonic] = _mnemo_decode(i.mnemonic)
+    i.mnemonic, icc, annul, cond, i.spec = r
+    if icc:
         i.misc["icc"] = True
-    if i.mnemonic.endswith(",a"):
+    if annul:
         i.misc["annul"] = True
-        i.mnemonic = i.mnemonic.rstrip(",a")
-    if i.mnemonic in b_synonyms:
-        i.mnemonic = b_synonyms[i.mnemonic]
-    if i.mnemonic in b_cond:
-        i.cond = b_cond[i.mnemonic]
-        i.mnemonic = "b"
-    if i.mnemonic in t_synonyms:
-        i.mnemonic = t_synonyms[i.mnemonic]
-    if i.mnemonic in t_cond:
-        i.cond = t_cond[i.mnemonic]
-        i.mnemonic = "t"
-    if i.mnemonic == "call":
-        if len(i.operands) > 1 and i.operands[1] != cst(0):
-            raise ValueError("call has a non-zero second argument")
-        i.operands = [i.operands[0]]
+    if cond is not None:
+        i.cond = cond
     # Additional internal tweaks
-    if i.mnemonic == "sethi" and i.operands[0]._is_cst:
-        i.operands[0].size = 22
-    elif i.mnemonic == "std":
-        i.rd = env.r.index(i.operands[0])
-    elif i.mnemonic == "ldd":
-        i.rd = env.r.index(i.operands[1])
-    i.spec = spec_table[i.mnemonic]
+    h = _POST_HANDLERS.get(i.mnemonic)
+    if h is not None:
+        h(i)
     i.bytes = (0, 0, 0, 0)  # To have i.length == 4, for pc_npc emulation
     return i
 
 
+# ------------------------------------------------------------------------------
+# hand-written parser for the same sparc assembler syntax, which avoids the
+# backtracking of pyparsing alternatives. It tokenizes the input string with
+# a single regular expression and evaluates operands expressions by recursive
+# descent, with the same operators precedence as sparc_syntax.exp.
+class sparc_syntax_fast:
+    tokens = re.compile(
+        r"""\s*(?:
+        (?P<comment>\#.*)
+        |(?P<hexa>0[xX][0-9a-fA-F]+)
+        |(?P<bina>0[bB][01]+)
+        |(?P<octa>0[0-7]*)
+        |(?P<integer>[1-9][0-9]*)
+        |(?P<char>'.|'\\\\)
+        |(?P<symbol>[A-Za-z_.$][A-Za-z0-9_.$]*)
+        |(?P<reg>%[A-Za-z_.$][A-Za-z0-9_.$]*)
+        |(?P<op>==|!=|<=|>=|<>|&&|\|\||[-~+*/<>^&|])
+        |(?P<punct>[][(),])
+        )""",
+        re.VERBOSE,
+    )
+    numbase = {"hexa": 16, "bina": 2, "octa": 8, "integer": 10}
+    op_one = ("-", "~")
+    # binary operators, from highest to lowest precedence:
+    operators = (
+        ("+", "-"),
+        ("*", "/"),
+        ("==", "!=", "<=", ">=", "<", ">", "<>"),
+        ("^", "&&", "||", "&", "|"),
+    )
+
+    @classmethod
+    def tokenize(cls, s):
+        T = []
+        pos = 0
+        while pos < len(s):
+            m = cls.tokens.match(s, pos)
+            if m is None:
+                if s[pos:].strip():
+                    raise pp.ParseException(s, pos, "invalid token")
+                break
+            if m.lastgroup != "comment":
+                T.append((m.lastgroup, m.group(m.lastgroup), m.start(m.lastgroup)))
+            pos = m.end()
+        T.append((None, None, len(s)))
+        return T
+
+    def __init__(self, s):
+        self.s = s
+        self.T = self.tokenize(s)
+        self.p = 0
+
+    def error(self, msg):
+        raise pp.ParseException(self.s, self.T[self.p][2], msg)
+
+    def peek(self):
+        return self.T[self.p][1]
+
+    def next(self):
+        t = self.T[self.p]
+        self.p += 1
+        return t
+
+    def expect(self, v):
+        if self.peek() != v:
+            self.error("expected %r" % v)
+        self.p += 1
+
+    def atom(self):
+        kind, v, _ = self.next()
+        if kind in self.numbase:
+            return env.cst(int(v, self.numbase[kind]), 32)
+        if kind == "char":
+            return env.cst(ord(v[-1]), 32)
+        if kind == "symbol":
+            return env.ext(v, size=32)
+        if kind == "reg":
+            if v in ("%hi", "%lo"):
+                self.expect("(")
+                x = self.exp()
+                self.expect(")")
+                return env.hi(x) if v == "%hi" else env.lo(x).zeroextend(32)
+            return _getreg(v[1:])
+        if v == "(":
+            x = self.exp()
+            self.expect(")")
+            return x
+        self.p -= 1
+        self.error("expected an operand")
+
+    def unary(self):
+        kind, v, _ = self.T[self.p]
+        if kind == "op" and v in self.op_one:
+            self.p += 1
+            return env.oper(v, self.unary())
+        return self.atom()
+
+    def binary(self, level):
+        if level < 0:
+            return self.unary()
+        ops = self.operators[level]
+        l = self.binary(level - 1)
+        while self.T[self.p][0] == "op" and self.peek() in ops:
+            o = self.next()[1]
+            l = env.oper(o, l, self.binary(level - 1))
+        return l
+
+    def exp(self):
+        return self.binary(len(self.operators) - 1)
+
+    def opd(self):
+        if self.peek() == "[":
+            self.p += 1
+            x = self.exp()
+            self.expect("]")
+            return env.mem(x)
+        return self.exp()
+
+    def instr(self):
+        kind, v, _ = self.next()
+        if kind != "symbol":
+            self.p -= 1
+            self.error("expected a mnemonic")
+        mnemonic = v.lower()
+        if self.peek() == "," and self.T[self.p + 1][1] == "a":
+            mnemonic += ",a"
+            self.p += 2
+        operands = []
+        if self.peek() is not None:
+            operands.append(self.opd())
+            while self.peek() == ",":
+                self.p += 1
+                operands.append(self.opd())
+        if self.peek() is not None:
+            self.error("expected end of text")
+        i = instruction(b"")
+        i.mnemonic = mnemonic
+        if operands:
+            i.operands = operands
+        return asmhelper(i)
+
+    @classmethod
+    def parse(cls, s):
+        "returns the sparc instruction parsed from assembly string s"
+        return cls(s).instr()
+
+
 # ----------------------------
 # for testing:
 
@@ -2468,3 +2468,14 @@ class vecw(top):
         sta, sto, stp = i.indices(self.size)
         l = [e[sta:sto] for e in self.l]
         return vecw(vec(l))
+
+
+# names exported by "from amoco.cas.expressions import *" (as done by all
+# architectures' env modules), which excludes the modules/objects imported
+# above by this module:
+__all__ = [
+    k
+    for k in list(globals())
+    if not k.startswith("_")
+    and k not in ("conf", "Log", "logger", "render", "Engine", "operator")
+]
@@ -4,62 +4,77 @@
 # Copyright (C) 2012 Axel Tillequin (bdcht3@gmail.com)
 # published under GPLv2 license
 
+from collections import defaultdict
+
 
 class generation(dict):
     def lastdict(self):
         return self
 
+    _hist_k = _hist_prev = None
+
+    @property
+    def hist(self):
+        # (key, previous value) of the last assignment:
+        return (self._hist_k, self._hist_prev)
+
     def __setitem__(self, k, v):
-        self.hist = (k, self.get(k, k))
-        return super().__setitem__(k, v)
+        self._hist_k = k
+        self._hist_prev = dict.get(self, k, k)
+        dict.__setitem__(self, k, v)
 
     def __getitem__(self, k):
         return self.get(k, None)
 
     def cleanup(self):
-        K = [k for k in self if k._is_reg]
-        for k in K:
-            del self[k]
+        kept = {k: v for k, v in self.items() if not k._is_reg}
+        self.clear()
+        dict.update(self, kept)
 
 
 class nextgeneration(object):
-    def __init__(self, *args, **kargs):
-        self.od = dict(*args, **kargs)
+    """
+    A dict-like object that keeps track of all successive values written
+    for each key. The latest values are stored directly in a dict, while
+    the history of values (needed by keygen/getgen) is maintained only if
+    track_history is True (default).
+    """
 
-    def __getall(self, k):
-        return self.od.get(k, [])
+    def __init__(self, *args, track_history=True, **kargs):
+        self.latest = dict(*args, **kargs)
+        self.hist = None
+        if track_history:
+            self.hist = defaultdict(list)
+            for k, v in self.latest.items():
+                self.hist[k].append(v)
 
     def __setitem__(self, k, v):
-        oldv = self.__getall(k)
-        oldv.append(v)
-        self.od[k] = oldv
+        self.latest[k] = v
+        if self.hist is not None:
+            self.hist[k].append(v)
 
     def __getitem__(self, k):
-        v = self.__getall(k)
-        try:
-            return v[-1]
-        except IndexError:
-            return None
+        return self.latest.get(k)
 
     def get(self, k, default):
-        r = self[k]
+        r = self.latest.get(k)
         if r is None:
             r = default
         return r
 
     def keygen(self, k, g):
-        v = self.__getall(k)
-        return v[g]
+        if self.hist is None:
+            raise ValueError("history is not tracked")
+        return self.hist.get(k, [])[g]
 
     # order at generation g is conserved;
     def getgen(self, g):
+        if self.hist is None:
+            raise ValueError("history is not tracked")
         d = nextgeneration()
-        for k in self.od:
-            d[k] = self.keygen(k, g)
+        d.latest = {k: v[g] for k, v in self.hist.items()}
+        d.hist = defaultdict(list, ((k, [v]) for k, v in d.latest.items()))
         return d
 
     def lastdict(self):
-        d = dict()
-        for k in self.od:
-            d[k] = self[k]
-        return d
+        return dict(self.latest)
@@ -1,60 +1,60 @@
+import importlib
+
 from amoco.config import conf
 from amoco.system.core import DefineLoader, logger
 from amoco.system import elf
 
+# OS modules used by the loaders below, imported only on first use:
+_OS_MODULES = {
+    "arm": "amoco.system.linux32.arm",
+    "x86": "amoco.system.linux32.x86",
+    "sparc": "amoco.system.linux32.sparc",
+    "riscv": "amoco.system.linux32.riscv",
+    "sh2": "amoco.system.linux32.sh2",
+    "mips_le": "amoco.system.linux32.mips_le",
+    "mips": "amoco.system.linux32.mips",
+}
+
+
+def _load(p, name, tag):
+    mod = _OS_MODULES[name]
+    if isinstance(mod, str):
+        mod = _OS_MODULES[name] = importlib.import_module(mod)
+    logger.info("linux32/%s task loading...", tag)
+    return mod.OS.loader(p, conf.System)
+
 
 @DefineLoader("elf", elf.EM_ARM)
 def loader_arm(p):
-    from amoco.system.linux32.arm import OS
-
-    logger.info("linux32/armv7 task loading...")
-    return OS.loader(p, conf.System)
+    return _load(p, "arm", "armv7")
 
 
 @DefineLoader("elf", elf.EM_386)
 def loader_x86(p):
-    from amoco.system.linux32.x86 import OS
-
-    logger.info("linux32/x86 task loading...")
-    return OS.loader(p, conf.System)
+    return _load(p, "x86", "x86")
 
 
 @DefineLoader("elf", elf.EM_SPARC)
 def loader_sparc(p):
-    from amoco.system.linux32.sparc import OS
-
-    logger.info("linux32/sparc task loading...")
-    return OS.loader(p, conf.System)
+    return _load(p, "sparc", "sparc")
 
 
 @DefineLoader("elf", elf.EM_RISCV)
 def loader_riscv(p):
-    from amoco.system.linux32.riscv import OS
-
-    logger.info("linux32/riscv task loading...")
-    return OS.loader(p, conf.System)
+    return _load(p, "riscv", "riscv")
 
 
 @DefineLoader("elf", elf.EM_SH)
 def loader_sh2(p):
-    from amoco.system.linux32.sh2 import OS
-
-    logger.info("linux32/sh2 task loading...")
-    return OS.loader(p, conf.System)
+    return _load(p, "sh2", "sh2")
 
 
 @DefineLoader("elf", elf.EM_MIPS)
 def loader_mips(p):
     if p.header.e_ident.EI_DATA == elf.ELFDATA2LSB:
-        from amoco.system.linux32.mips_le import OS
-
-        logger.info("linux32/mips_le task loading...")
-        return OS.loader(p, conf.System)
+        return _load(p, "mips_le", "mips_le")
     if p.header.e_ident.EI_DATA == elf.ELFDATA2MSB:
-        from amoco.system.linux32.mips import OS
-
-        logger.info("linux32/mips (MSB) task loading...")
-        return OS.loader(p, conf.System)
+        return _load(p, "mips", "mips (MSB)")
     else:
         logger.error("no endianess defined in ELF header")
         return None
@@ -5,6 +5,7 @@
 # published under GPLv2 license
 
 import struct
+from functools import lru_cache
 
 from amoco.logger import Log
 
@@ -14,9 +15,58 @@ logger.debug("loading module")
 from .core import StructCore, Alltypes
 from .utils import read_leb128, write_uleb128, write_sleb128
 
+# raw type of pointers (and longs) for a given psize:
+_PTR_TN = {4: "I", 8: "Q", 32: "I", 64: "Q"}
+
+
+@lru_cache(maxsize=512)
+def _struct(fmt):
+    "returns the (cached) compiled struct.Struct object for format fmt"
+    return struct.Struct(fmt)
+
+
+def _unpack_at(S, data, offset, sz=None):
+    """unpacks Struct S from data at given offset, directly from the buffer
+    if data supports it (bytes-like), or from a slice otherwise (DataIO).
+    If the expected byte size sz differs from S.size (like for the native
+    size of a 'L' RawField on LP64), unpacking fails."""
+    if sz is not None and sz != S.size:
+        return S.unpack(data[offset : offset + sz])
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return S.unpack_from(data, offset)
+    return S.unpack(data[offset : offset + S.size])
+
+
+def _unpack_fmt_at(fmt, data, offset):
+    """same as _unpack_at for a format that depends on decoded values (like
+    the count of a CntField), which is not worth keeping in _struct cache."""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return struct.unpack_from(fmt, data, offset)
+    return struct.unpack(fmt, data[offset : offset + struct.calcsize(fmt)])
+
+
 # ------------------------------------------------------------------------------
 
 
+class _fieldtype(object):
+    """
+    Non-data descriptor for the Field.type attribute: the type associated
+    with the field's typename is looked up in Alltypes on first access only,
+    and then stored in the field's instance dict which shadows the descriptor.
+    """
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        try:
+            cls = Alltypes[obj.typename]
+        except KeyError:
+            logger.warning("type %s is not defined" % obj.typename)
+            return None
+        obj.__dict__["type"] = cls
+        return cls
+
+
 class Field(object):
     """
     A Field object defines an element of a structure class, associating a name
@@ -48,9 +98,8 @@ class Field(object):
     """
 
     def __init__(self, ftype, fcount=0, fname=None, forder=None, falign=1, fcomment=""):
-        self.__type = None
         if isinstance(ftype, type):
-            self.__type = ftype
+            self.__dict__["type"] = ftype
             self.typename = ftype.__name__
         else:
             self.typename = ftype
@@ -61,16 +110,7 @@ class Field(object):
         self.comment = fcomment
         self.instance = None
 
-    @property
-    def type(self):
-        if self.__type is None:
-            try:
-                cls = Alltypes[self.typename]
-            except KeyError:
-                logger.warning("type %s is not defined" % self.typename)
-            else:
-                self.__type = cls
-        return self.__type
+    type = _fieldtype()
 
     def format(self, psize=0):
         """
@@ -83,20 +123,20 @@ class Field(object):
     def size(self, psize=0):
         # if the field belongs to an instance and was unpacked already,
         # we return the actual byte-length of the resulting struct:
-        try:
-            return len(self.instance[self.name])
-        except Exception:
-            pass
+        obj = self.instance
+        if obj is not None and self.name:
+            v = getattr(obj._v, self.name, None)
+            if hasattr(v, "__len__"):
+                return len(v)
         # otherwise we return the natural size of the field's type,
         # which may be infinite if the type contains a VarField...
-        try:
-            sz = self.type.size(psize)
-        except AttributeError:
+        T = self.type
+        if T is None:
             return float("Infinity")
-        else:
-            if self.count > 0:
-                sz = sz * self.count
-            return sz
+        sz = T.size(psize)
+        if self.count > 0:
+            sz = sz * self.count
+        return sz
 
     @property
     def source(self):
@@ -140,31 +180,24 @@ class Field(object):
 
     def unpack(self, data, offset=0, psize=0):
         "returns a (sequence of count) element(s) of its self.type"
-        blob = self.type().unpack(data, offset, psize)
-        if self.count > 0:
-            # since we are not a RawField, blob is normally a StructCore instance,
-            # but it can be a python raw type in case self is a typedef.
-            # Thus, we need to declare a 'sizeof' operator to correctly compute
-            # the size of each unpacked blob:
-            if isinstance(blob, (bytes, StructCore)):
-                sizeof = lambda b: len(b)
+        T = self.type
+        if self.count == 0:
+            return T().unpack(data, offset, psize)
+        sz = T.size(psize)
+        if sz < float("Infinity"):
+            # elements of a fixed-size type are located every sz bytes:
+            return [T().unpack(data, offset + i * sz, psize) for i in range(self.count)]
+        # otherwise we need to compute the size of each unpacked blob.
+        # Since we are not a RawField, blob is normally a StructCore instance,
+        # but it can be a python raw type in case self is a typedef.
+        blob = []
+        for _ in range(self.count):
+            b = T().unpack(data, offset, psize)
+            blob.append(b)
+            if isinstance(b, (bytes, StructCore)):
+                offset += len(b)
             else:
-                sz = self.type.size(psize)
-                if sz < float("Infinity"):
-                    sizeof = lambda b: sz
-                else:
-                    sizeof = lambda b: sum((x.size(psize) for x in b), 0)
-            # now lets unpack the rest of the series:
-            sz = sizeof(blob)
-            count = self.count
-            blob = [blob]
-            count -= 1
-            offset += sz
-            while count > 0:
-                nextblob = self.type().unpack(data, offset, psize)
-                blob.append(nextblob)
-                offset += sizeof(nextblob)
-                count -= 1
+                offset += sum((x.size(psize) for x in b), 0)
         return blob
 
     def get(self, data, offset=0, psize=0):
@@ -185,6 +218,8 @@ class Field(object):
             self._align_value,
             self.comment,
         )
+        if "type" in self.__dict__:
+            newf.__dict__["type"] = self.__dict__["type"]
         newf.instance = obj
         return newf
 
@@ -192,10 +227,8 @@ class Field(object):
         return self.copy()
 
     def __repr__(self):
-        try:
-            fmt = self.type.format()
-        except (AttributeError, KeyError):
-            fmt = "?"
+        T = self.type
+        fmt = "?" if T is None else T.format()
         r = "<Field %s {%s}" % (self.name, fmt)
         if self.count > 0:
             r += "*%d" % self.count
@@ -229,9 +262,8 @@ class RawField(Field):
     def align_value(self, psize=0):
         tn = self.typename
         if psize and (tn in ("P", "L", "l")):
-            tn = {4: "I", 8: "Q", 32: "I", 64: "Q"}.get(psize, tn)
-        sz = struct.calcsize(tn)
-        return sz
+            tn = _PTR_TN.get(psize, tn)
+        return _struct(tn).size
 
     def size(self, psize=0):
         sz = self.align_value(psize)
@@ -240,14 +272,16 @@ class RawField(Field):
         return sz
 
     def unpack(self, data, offset=0, psize=0):
-        pfx = "%d" % self.count if self.count > 0 else ""
         tn = self.typename
         if psize and tn in ("P", "L", "l"):
-            tn = {4: "I", 8: "Q", 32: "I", 64: "Q"}.get(psize, tn)
-        res = struct.unpack(
-            self.order + pfx + tn, data[offset : offset + self.size(psize)]
-        )
-        if self.count == 0 or tn == "s":
+            tn = _PTR_TN.get(psize, tn)
+        if self.count == 0:
+            # scalar fast path:
+            S = _struct(self.order + tn)
+            return _unpack_at(S, data, offset, self.size(psize))[0]
+        S = _struct(self.order + "%d" % self.count + tn)
+        res = _unpack_at(S, data, offset, self.size(psize))
+        if tn == "s":
             return res[0]
         if tn == "c":
             return b"".join(res)
@@ -256,12 +290,12 @@ class RawField(Field):
     def pack(self, value, psize=0):
         fmt = self.typename
         if psize and fmt in ("P", "L", "l"):
-            fmt = {4: "I", 8: "Q", 32: "I", 64: "Q"}.get(psize, fmt)
+            fmt = _PTR_TN.get(psize, fmt)
         pfx = "%d" % self.count if self.count > 0 else ""
         order = self.ORDER if hasattr(self, "ORDER") else self.order
         if fmt == "c" and isinstance(value, bytes):
             fmt = "s"
-        res = struct.pack(order + pfx + fmt, value)
+        res = _struct(order + pfx + fmt).pack(value)
         return res
 
     def __repr__(self):
@@ -276,22 +310,30 @@ class RawField(Field):
 # ------------------------------------------------------------------------------
 
 
-class BitField(RawField):
+@lru_cache(maxsize=256)
+def _bitcodec(subnames, subsizes):
     """
-    A BitField is a 0-count RawField with additional subnames and subsizes to allow
-    unpack the type into several named values each of given bit sizes.
-
-    Note that The order of subfields in a BitField **always** goes from LSB to MSB.
-    Subfields are unpacked once the BitField type has been unpacked according to
-    its own endianness indicator.
-
-    Arguments:
-        - The ftype argument is the one that gets "splitted" into parts of bits.
-        - The fcount argument is a list that defines the size of each splitted part
-          from least to most significant bit.
-        - The fname argument is a list that defines the name of each splitted part
-          according to fcount.
-        - the forder argument indicates the byte ordering (not the bit ordering.)
+    returns the (pack, unpack) functions of bitfield subfields. These functions
+    are generated once per subfields layout (given as tuples) so that each
+    subfield is extracted (or inserted) with constant shift and mask values.
+    """
+    layout = []
+    l = 0
+    for name, sz in zip(subnames, subsizes):
+        layout.append((name, l, (1 << sz) - 1))
+        l += sz
+    p = " | ".join(["((D[%r] & %#x) << %d)" % (n, m, s) for (n, s, m) in layout])
+    u = ", ".join(["%r: (v >> %d) & %#x" % (n, s, m) for (n, s, m) in layout])
+    packfn = eval("lambda D: %s" % (p or "0"), {})
+    unpackfn = eval("lambda v: {%s}" % u, {})
+    return packfn, unpackfn
+
+
+class _BitLayoutMixin(object):
+    """
+    Provides the subfields logic shared by BitField and BitFieldEx: this
+    class must come first in their bases so that its unpack/pack methods
+    wrap those of the underlying Field class.
     """
 
     def __init__(self, ftype, fcount=0, fname=None, forder=None, falign=1, fcomment=""):
@@ -300,26 +342,27 @@ class BitField(RawField):
         # names of each splitted part is provided here:
         self.subnames = fname or []
         # other attributes are as usual...
+        self._packfn, self._unpackfn = _bitcodec(
+            tuple(self.subnames), tuple(self.subsizes)
+        )
+
+    def __getstate__(self):
+        # generated functions can't be pickled:
+        S = dict(self.__dict__)
+        del S["_packfn"], S["_unpackfn"]
+        return S
+
+    def __setstate__(self, S):
+        self.__dict__.update(S)
+        self._packfn, self._unpackfn = _bitcodec(
+            tuple(self.subnames), tuple(self.subsizes)
+        )
 
     def unpack(self, data, offset=0, psize=0):
-        value = super().unpack(data, offset)
-        D = {}
-        l = 0
-        for name, sz in zip(self.subnames, self.subsizes):
-            mask = (1 << sz) - 1
-            D[name] = (value >> l) & mask
-            l += sz
-        return D
+        return self._unpackfn(super().unpack(data, offset))
 
     def pack(self, D, psize=0):
-        value = 0
-        l = 0
-        for x, sz in zip(self.subnames, self.subsizes):
-            mask = (1 << sz) - 1
-            v = (D[x] & mask) << l
-            value |= v
-            l += sz
-        return super().pack(value, psize)
+        return super().pack(self._packfn(D), psize)
 
     def copy(self, obj=None):
         cls = self.__class__
@@ -331,6 +374,10 @@ class BitField(RawField):
             self._align_value,
             self.comment,
         )
+        # subfields layout is the same:
+        newf._packfn, newf._unpackfn = self._packfn, self._unpackfn
+        if "type" in self.__dict__:
+            newf.__dict__["type"] = self.__dict__["type"]
         newf.instance = obj
         return newf
 
@@ -341,10 +388,32 @@ class BitField(RawField):
             self.subsizes.append(oss.pop(0))
             if osn:
                 self.subnames.append(osn.pop(0))
+        self._packfn, self._unpackfn = _bitcodec(
+            tuple(self.subnames), tuple(self.subsizes)
+        )
         if oss or osn:
             logger.debug("BitField size too small in %s" % self)
             raise TypeError
 
+
+class BitField(_BitLayoutMixin, RawField):
+    """
+    A BitField is a 0-count RawField with additional subnames and subsizes to allow
+    unpack the type into several named values each of given bit sizes.
+
+    Note that The order of subfields in a BitField **always** goes from LSB to MSB.
+    Subfields are unpacked once the BitField type has been unpacked according to
+    its own endianness indicator.
+
+    Arguments:
+        - The ftype argument is the one that gets "splitted" into parts of bits.
+        - The fcount argument is a list that defines the size of each splitted part
+          from least to most significant bit.
+        - The fname argument is a list that defines the name of each splitted part
+          according to fcount.
+        - the forder argument indicates the byte ordering (not the bit ordering.)
+    """
+
     def __repr__(self):
         pre = " " * 7
         f = [pre + "%s:%s" % (n, s) for n, s in zip(self.subnames, self.subsizes)]
@@ -352,52 +421,12 @@ class BitField(RawField):
         return "<Field %s>" % s
 
 
-class BitFieldEx(Field):
+class BitFieldEx(_BitLayoutMixin, Field):
     """
     A BitFieldEx is identical to a BitField but inherits from Field rather than RawField.
     This allows to rely on a type that has been defined from a macro or a typedef.
     """
 
-    def __init__(self, ftype, fcount=0, fname=None, forder=None, falign=1, fcomment=""):
-        super().__init__(ftype, 0, "", forder, falign, fcomment)
-        self.subsizes = fcount or []
-        # names of each splitted part is provided here:
-        self.subnames = fname or []
-        # other attributes are as usual...
-
-    def unpack(self, data, offset=0, psize=0):
-        value = super().unpack(data, offset)
-        D = {}
-        l = 0
-        for name, sz in zip(self.subnames, self.subsizes):
-            mask = (1 << sz) - 1
-            D[name] = (value >> l) & mask
-            l += sz
-        return D
-
-    def pack(self, D, psize=0):
-        value = 0
-        l = 0
-        for x, sz in zip(self.subnames, self.subsizes):
-            mask = (1 << sz) - 1
-            v = (D[x] & mask) << l
-            value |= v
-            l += sz
-        return super().pack(value, psize)
-
-    def copy(self, obj=None):
-        cls = self.__class__
-        newf = cls(
-            self.typename,
-            self.subsizes,
-            self.subnames,
-            self.order,
-            self._align_value,
-            self.comment,
-        )
-        newf.instance = obj
-        return newf
-
     def __repr__(self):
         r = "<Field %s>" % str(
             ["%s:%s" % (n, s) for n, s in zip(self.subnames, self.subsizes)]
@@ -429,33 +458,73 @@ class VarField(RawField):
         except AttributeError:
             return float("Infinity")
 
+    # number of elements decoded at once when looking for a null terminator:
+    SCAN = 64
+
     def unpack(self, data, offset=0, psize=0):
+        if not hasattr(self, "_terminate") and isinstance(data, (bytes, bytearray)):
+            res = self._unpack_null_terminated(data, offset)
+            if res is not None:
+                return res
         tn = self.typename
         if psize and tn == "P":
-            tn = {4: "I", 8: "Q", 32: "I", 64: "Q"}.get(psize, "P")
+            tn = _PTR_TN.get(psize, "P")
         sz1 = struct.calcsize(tn)
-        el1 = data[offset : offset + sz1]
-        el1 = struct.unpack(self.order + self.typename, el1)[0]
+        S = _struct(self.order + self.typename)
+        el1 = _unpack_at(S, data, offset)[0]
         res = [el1]
         pos = offset + sz1
         while not self.terminate(el1, field=self):
-            el1 = data[pos : pos + sz1]
-            el1 = struct.unpack(self.order + self.typename, el1)[0]
+            el1 = _unpack_at(S, data, pos)[0]
             res.append(el1)
             pos += sz1
-            self._sz = pos - offset
-            self.count = len(res)
+        self._sz = pos - offset
+        self.count = len(res)
         if self.typename == "s":
             return b"".join(res)
         if self.typename == "c":
             return b"".join(res)
         return res
 
+    def _unpack_null_terminated(self, data, offset):
+        # fast path for the default terminate condition: the terminator is
+        # searched with bytes.find for byte elements, or within blocks of
+        # SCAN elements otherwise. Returns None if no terminator is found.
+        tn = self.typename
+        if tn in ("s", "c", "B"):
+            end = data.find(b"\0", offset)
+            if end < 0:
+                return None
+            end += 1
+            self._sz = self.count = end - offset
+            res = bytes(data[offset:end])
+            return list(res) if tn == "B" else res
+        S = _struct(self.order + tn)
+        res = []
+        pos = offset
+        while True:
+            chunk = data[pos : pos + S.size * self.SCAN]
+            n = len(chunk) - (len(chunk) % S.size)
+            if n == 0:
+                return None
+            vals = [v for (v,) in S.iter_unpack(chunk[:n])]
+            if 0 in vals:
+                k = vals.index(0) + 1
+                res.extend(vals[:k])
+                pos += k * S.size
+                break
+            res.extend(vals)
+            pos += n
+        self._sz = pos - offset
+        self.count = len(res)
+        return res
+
     def pack(self, value, psize=0):
         tn = self.typename
         if psize and tn == "P":
-            tn = {4: "I", 8: "Q", 32: "I", 64: "Q"}.get(psize, "P")
-        res = [struct.pack(self.order + tn, v) for v in value]
+            tn = _PTR_TN.get(psize, "P")
+        S = _struct(self.order + tn)
+        res = [S.pack(v) for v in value]
         return b"".join(res)
 
     def copy(self, obj=None):
@@ -547,7 +616,7 @@ class CntField(RawField):
     def format(self, psize=0):
         fmt = self.typename
         if psize and fmt == "P":
-            fmt = {4: "I", 8: "Q", 32: "I", 64: "Q"}.get(psize, "P")
+            fmt = _PTR_TN.get(psize, "P")
         # fcount is used as a placeholder for the initial fcount value
         # that correspond to the formatting of the counter. For example
         # for a CntField defined from s*~I, the typename is 's' and the
@@ -564,10 +633,18 @@ class CntField(RawField):
         return "%s%s" % (cnt, fmt)
 
     def size(self, psize=0):
-        try:
-            return struct.calcsize(self.format(psize))
-        except Exception:
+        # the size is infinite until the actual count has been decoded:
+        if not hasattr(self, "fcount"):
             return float("Infinity")
+        # otherwise it only depends on psize until next (un)pack:
+        sz = self._sizes.get(psize)
+        if sz is None:
+            try:
+                sz = struct.calcsize(self.format(psize))
+            except Exception:
+                sz = float("Infinity")
+            self._sizes[psize] = sz
+        return sz
 
     def unpack(self, data, offset=0, psize=0):
         if hasattr(self, "fcount"):
@@ -575,21 +652,18 @@ class CntField(RawField):
             # the count to its initial form.
             self.count = self.fcount
         # decode the actual count:
-        sz = struct.calcsize(self.count[1:])  # (skip '~')
-        nb = data[offset : offset + sz]
-        nb = struct.unpack(self.order + self.count[1:], nb)[0]
+        S = _struct(self.order + self.count[1:])  # (skip '~')
+        nb = _unpack_at(S, data, offset)[0]
         # save the initial count form
         self.fcount = self.count
         # ...before overwritting with actual value:
         self.count = nb
+        self._sizes = {}
         if self.count == 0:
             res = [0, b""]
         else:
             # now fully unpack the whole field:
-            res = struct.unpack(
-                self.order + self.format(psize),
-                data[offset : offset + self.size(psize)],
-            )
+            res = _unpack_fmt_at(self.order + self.format(psize), data, offset)
         if self.typename == "s":
             return res[1]
         if self.typename == "c":
@@ -602,6 +676,7 @@ class CntField(RawField):
         if not hasattr(self, "fcount"):
             self.fcount = self.count
         self.count = len(value)
+        self._sizes = {}
         if isinstance(value, list):
             res = struct.pack(self.order + self.format(psize), self.count, *value)
         else:
@@ -627,7 +702,7 @@ class BindedField(CntField):
     def format(self, psize=0):
         fmt = self.typename
         if psize and fmt == "P":
-            fmt = {4: "I", 8: "Q", 32: "I", 64: "Q"}.get(psize, "P")
+            fmt = _PTR_TN.get(psize, "P")
         if hasattr(self, "fcount"):
             cnt = self.count
         else:
@@ -636,23 +711,16 @@ class BindedField(CntField):
             return ""
         return "%s%s" % (cnt, fmt)
 
-    def size(self, psize=0):
-        try:
-            return struct.calcsize(self.format(psize))
-        except Exception:
-            return float("Infinity")
-
     def unpack(self, data, offset=0, psize=0):
         if hasattr(self, "fcount"):
             self.count = self.fcount
         self.fcount = self.count
         boundname = self.count[1:]
         self.count = self.instance[boundname]
+        self._sizes = {}
         if self.count == 0:
             return None
-        res = struct.unpack(
-            self.order + self.format(psize), data[offset : offset + self.size(psize)]
-        )
+        res = _unpack_fmt_at(self.order + self.format(psize), data, offset)
         if self.typename == "s":
             return res[0]
         return res
@@ -9,14 +9,22 @@ def read_leb128(data, sign=1, offset=0):
     result = 0
     shift = 0
     count = 0
-    for b in data[offset:]:
-        if isinstance(b, bytes):
-            b = ord(b)
-        count += 1
-        result |= (b & 0x7F) << shift
-        shift += 7
-        if b & 0x80 == 0:
-            break
+    b = 0
+    # data is read by small chunks rather than sliced up to its end, since
+    # the encoded value is usually a few bytes long in a much larger buffer:
+    chunk = data[offset : offset + 16]
+    while chunk:
+        for b in chunk:
+            if isinstance(b, bytes):
+                b = ord(b)
+            count += 1
+            result |= (b & 0x7F) << shift
+            shift += 7
+            if b & 0x80 == 0:
+                chunk = None
+                break
+        else:
+            chunk = data[offset + count : offset + count + 16]
     if sign < 0 and (b & 0x40):
         result |= ~0 << shift
     return result, count
@@ -8,6 +8,11 @@ from amoco.system.core import CoreExec, DefineStub
 from amoco.code import callstack
 from amoco.arch.x86.cpu_x86 import cpu
 
+# mnemonics that open/close a callstack frame in Task.helper_callstack
+# (x86 mnemonics are upper case, lower case forms are kept for safety):
+_CALL_MNEMONICS = frozenset(("CALL", "JMPF", "CALLF", "call", "jmpf", "callf"))
+_RET_MNEMONICS = frozenset(("RET", "RETF", "ret", "retf"))
+
 # ------------------------------------------------------------------------------
 
 
@@ -44,24 +49,27 @@ class OS(object):
         p = Task(pe, cpu)
         p.OS = self
         # map PE header at ImageBase:
-        vaddr = pe.Opt.ImageBase
-        p.state.mmap.write(vaddr, b"\0" * pe.Opt.SizeOfImage)
-        p.state.mmap.write(vaddr, pe.dataio[0 : pe.Opt.SizeOfHeaders])
+        base = pe.Opt.ImageBase
+        segs = [(base, pe.dataio[0 : pe.Opt.SizeOfHeaders])]
         # create text and data segments according to elf header:
         for s in pe.sections:
             ms = pe.loadsegment(s, pe.Opt.SectionAlignment)
             if ms is not None:
-                vaddr, data = ms.popitem()
-                p.state.mmap.write(vaddr, data)
+                segs.append(ms.popitem())
+        # zero-fill only the parts of the image not covered above, by padding
+        # each segment up to the next one:
+        segs.sort(key=lambda x: x[0])
+        ends = [v for v, _ in segs[1:]] + [base + pe.Opt.SizeOfImage]
+        for (vaddr, data), end in zip(segs, ends):
+            pad = end - vaddr - len(data)
+            if pad > 0:
+                data = data + b"\0" * pad
+            p.state.mmap.write(vaddr, data)
         # init task state:
         p.state[cpu.eip] = cpu.cst(p.bin.entrypoints[0], 32)
-        p.state[cpu.ebp] = cpu.cst(0, 32)
-        p.state[cpu.eax] = cpu.cst(0, 32)
-        p.state[cpu.ebx] = cpu.cst(0, 32)
-        p.state[cpu.ecx] = cpu.cst(0, 32)
-        p.state[cpu.edx] = cpu.cst(0, 32)
-        p.state[cpu.esi] = cpu.cst(0, 32)
-        p.state[cpu.edi] = cpu.cst(0, 32)
+        zero = cpu.cst(0, 32)
+        for r in (cpu.ebp, cpu.eax, cpu.ebx, cpu.ecx, cpu.edx, cpu.esi, cpu.edi):
+            p.state[r] = zero
         # create the stack space:
         if self.ASLR:
             p.state.mmap.newzone(p.cpu.esp)
@@ -100,7 +108,7 @@ class Task(CoreExec):
                 sp=self.state(cpu.esp),
             )
         cur = stk.cursor()
-        if i.mnemonic.lower() in ("call", "jmpf", "callf"):
+        if i.mnemonic in _CALL_MNEMONICS:
             addr = self.state(cpu.eip)
             symb = self.symbol_for(addr)
             cur.append(
@@ -108,7 +116,7 @@ class Task(CoreExec):
                     entry=addr, symbol=symb, caller=i.address, sp=self.state(cpu.esp)
                 )
             )
-        elif i.mnemonic.lower() in ("ret", "retf"):
+        elif i.mnemonic in _RET_MNEMONICS:
             cur.closed = True
             par = stk.cursor()
             if [(e.entry, e.caller) for e in par].count((cur.entry, cur.caller)) > 1:
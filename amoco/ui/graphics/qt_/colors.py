@@ -29,3 +29,8 @@ palette_trbg = {
     "SpanishPink": QColor(0xFB, 0xC3, 0xBC, 128),
     "YaleBlue": QColor(0x08, 0x48, 0x87, 128),
 }
+
+# index-based access to the palette:
+palette_names = tuple(palette_trbg)
+palette_colors = tuple(palette_trbg.values())
+palette_index = {n: i for i, n in enumerate(palette_names)}
@@ -35,7 +35,7 @@ class HexView(QAbstractScrollArea):
         self.setFont(f)
         self.setFocusPolicy(Qt.StrongFocus)
         self.setMouseTracking(True)
-        self.palette = cycle(colors.palette_trbg.values())
+        self.palette = cycle(colors.palette_colors)
         self.lastcolor = None
         # set default vertical scrolling steps:
         self.vb = self.verticalScrollBar()
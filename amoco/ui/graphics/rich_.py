@@ -114,15 +114,16 @@ class engine(object):
             collapse_padding=True,
             expand=True,
         )
-        for i in range(T.nrows):
-            if i in T.hidden_r:
+        hidden_r = T.hidden_r
+        for i, r in enumerate(T.rows):
+            if i in hidden_r:
                 if not T.squash_r:
                     rT.add_row(None)
             else:
-                if T.rows[i].label:
-                    rT.add_row(toks2rich([T.rows[i].label]), style="label")
-                rowstyle = "mark" if T.rows[i].has_tokentype("Mark") else None
-                rT.add_row(*rtrow(T.rows[i], **T.rowparams), style=rowstyle)
+                if r.label:
+                    rT.add_row(toks2rich([r.label]), style="label")
+                rowstyle = "mark" if r.has_tokentype("Mark") else None
+                rT.add_row(*rtrow(r, **T.rowparams), style=rowstyle)
         if rT.row_count > T.maxlength:
             rT.rows = rT.rows[: T.maxlength]
             for col in rT.columns:
@@ -263,14 +264,31 @@ def rtrow(row, **params):
     return r
 
 
+# rich markup (open, close) tags of each token type, Column tokens having
+# no tags (). Token types are created dynamically so this is filled on demand:
+_TAGS = {}
+
+
+def _tags(tt):
+    stt = str(tt)
+    if stt == "Token.Column":
+        tags = ()
+    else:
+        styles = stt.lower().split(".")[1:]
+        tags = ("".join(["[%s]" % x for x in styles]), "[/]" * len(styles))
+    _TAGS[tt] = tags
+    return tags
+
+
 def toks2rich(c, sep=""):
-    r = "%s" % sep
+    r = ["%s" % sep]
     for tt, tv in c:
-        stt = str(tt)
-        if stt == "Token.Column":
+        tags = _TAGS.get(tt)
+        if tags is None:
+            tags = _tags(tt)
+        if not tags:
             break
-        x = "%s" % escape(tv)
-        for style in reversed(stt.lower().split(".")[1:]):
-            x = "[%s]%s[/]" % (style, x)
-        r += x
-    return r
+        r.append(tags[0])
+        r.append(escape(tv))
+        r.append(tags[1])
+    return "".join(r)
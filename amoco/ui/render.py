@@ -24,6 +24,8 @@ from amoco.logger import Log
 logger = Log(__name__)
 logger.debug("loading module")
 
+import re
+from collections import Counter
 from pygments.token import Token
 
 
@@ -116,22 +118,81 @@ class vltable:
 
     def update(self, *rr):
         "recompute the column width over rr range of rows, and update colsize array"
+        # rows tokens may have been modified in place:
+        for r in self.rows:
+            r._widths = r._texts = None
+        self._rebuild()
         for c in range(self.ncols):
             cz = self.colsize.get(c, 0) if len(rr) > 0 else 0
             self.colsize[c] = max(cz, self.getcolsize(c, rr, squash=False))
 
     def getcolsize(self, c, rr=None, squash=True):
         "compute the given column width (over rr list of row indices if not None.)"
+        if rr:
+            return self._colsize(c, rr, squash)
+        # full-table widths are maintained incrementally:
+        self._sync()
+        if not (0 <= c < len(self._colmax)):
+            return self._colsize(c, range(self.nrows), squash)
+        if squash and self.rowparams["squash_c"]:
+            w = self._wvis[c]
+            return max(w) if w else 0
+        return self._colmax[c]
+
+    def _colsize(self, c, rr, squash):
+        hidden_r = self.hidden_r if squash and self.rowparams["squash_c"] else ()
+        rows = self.rows
         cz = 0
-        if not rr:
-            rr = range(self.nrows)
         for i in rr:
-            if self.rowparams["squash_c"] and (i in self.hidden_r):
-                if squash:
-                    continue
-            cz = max(cz, self.rows[i].colsize(c))
+            if i not in hidden_r:
+                cz = max(cz, rows[i].colsize(c))
         return cz
 
+    # Full-table column widths are maintained with, for each column, the max
+    # width over all rows (_colmax) and a Counter of the widths of visible rows
+    # (_wvis) so that adding, hiding or showing a row only costs O(ncols).
+    # These are rebuilt by update(), or whenever self.rows or self.hidden_r
+    # have been modified without using vltable methods (see _sync).
+
+    def _rebuild(self):
+        self._rows, self._nrows = self.rows, len(self.rows)
+        self._hidden, self._nhidden = self.hidden_r, len(self.hidden_r)
+        self._colmax = []
+        self._wvis = []
+        for i, r in enumerate(self.rows):
+            self._addwidths(i, r)
+
+    def _sync(self):
+        if (
+            self._rows is not self.rows
+            or self._nrows != len(self.rows)
+            or self._hidden is not self.hidden_r
+            or self._nhidden != len(self.hidden_r)
+        ):
+            self._rebuild()
+
+    def _addwidths(self, i, r):
+        for _ in range(len(self._colmax), r.ncols):
+            self._colmax.append(0)
+            self._wvis.append(Counter())
+        visible = i not in self.hidden_r
+        for c in range(r.ncols):
+            w = r.colsize(c)
+            if w > 0:
+                if w > self._colmax[c]:
+                    self._colmax[c] = w
+                if visible:
+                    self._wvis[c][w] += 1
+
+    def _hidewidths(self, r, delta):
+        for c in range(r.ncols):
+            w = r.colsize(c)
+            if w > 0:
+                wc = self._wvis[c]
+                wc[w] += delta
+                if wc[w] <= 0:
+                    del wc[w]
+
     @property
     def width(self):
         sep = self.rowparams.get("sep", "")
@@ -150,8 +211,13 @@ class vltable:
 
     def addrow(self, toks):
         "add row of given list of tokens and update table"
-        self.rows.append(tokenrow(toks))
-        self.update()
+        self._sync()
+        r = tokenrow(toks)
+        self.rows.append(r)
+        self._addwidths(self._nrows, r)
+        self._nrows += 1
+        for c, cz in enumerate(self._colmax):
+            self.colsize[c] = cz
         return self
 
     def addcolumn(self, lot, c=None):
@@ -173,11 +239,20 @@ class vltable:
 
     def hiderow(self, n):
         "hide given row"
-        self.hidden_r.add(n)
+        self._sync()
+        if n not in self.hidden_r:
+            self.hidden_r.add(n)
+            self._nhidden += 1
+            if 0 <= n < self._nrows:
+                self._hidewidths(self.rows[n], -1)
 
     def showrow(self, n):
         "show given row"
+        self._sync()
         self.hidden_r.remove(n)
+        self._nhidden -= 1
+        if 0 <= n < self._nrows:
+            self._hidewidths(self.rows[n], +1)
 
     def hidecolumn(self, n):
         "hide given column"
@@ -196,20 +271,17 @@ class vltable:
 
     def grep(self, regex, col=None, invert=False):
         "search for a regular expression in the table"
-        from re import search
-
-        L = set()
+        search = re.compile(regex).search
+        hidden_r, hidden_c = self.hidden_r, self.hidden_c
+        L = {
+            i
+            for i, r in enumerate(self.rows)
+            if i not in hidden_r
+            and any(
+                search(s) for c, s in enumerate(r.rawcols(col)) if c not in hidden_c
+            )
+        }
         R = range(self.nrows)
-        for i in R:
-            if i in self.hidden_r:
-                continue
-            C = self.rows[i].rawcols(col)
-            for c, s in enumerate(C):
-                if c in self.hidden_c:
-                    continue
-                if search(regex, s):
-                    L.add(i)
-                    break
         if not invert:
             L = set(R) - L
         for n in L:
@@ -252,6 +324,8 @@ class tokenrow(object):
         self.separator = ""
         toks = [(t, "%s" % s) for (t, s) in toks]
         self.cols = self.cut(toks)
+        # columns widths and raw strings, computed once when needed:
+        self._widths = self._texts = None
 
     def cut(self, toks):
         "cut the raw list of tokens into a list of column of tokens"
@@ -269,12 +343,19 @@ class tokenrow(object):
         c = col or []
         c.append((Token.Column, ""))
         self.cols.insert(index, c)
+        self._widths = self._texts = None
 
     def colsize(self, c):
         "return the column size (width)"
-        if c >= len(self.cols):
+        w = self._widths
+        if w is None:
+            C = Token.Column
+            w = self._widths = [
+                sum([len(v) for (t, v) in col if t != C]) for col in self.cols
+            ]
+        if c >= len(w):
             return 0
-        return sum((len(t[1]) for t in self.cols[c] if t[0] != Token.Column))
+        return w[c]
 
     @property
     def ncols(self):
@@ -282,13 +363,12 @@ class tokenrow(object):
 
     def rawcols(self, j=None):
         "return the raw (undecorated) string of this row (j-th column if given)"
-        r = []
-        cols = self.cols
+        r = self._texts
+        if r is None:
+            r = self._texts = ["".join([t[1] for t in c]) for c in self.cols]
         if j is not None:
-            cols = self.cols[j : j + 1]
-        for c in cols:
-            r.append("".join([t[1] for t in c]))
-        return r
+            return r[j : j + 1]
+        return list(r)
 
     def has_tokentype(self, tt):
         alltt = set()
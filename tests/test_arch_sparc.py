@@ -1,5 +1,7 @@
+import pytest
+
 from amoco.arch.sparc.cpu_v8 import cpu
-from amoco.arch.sparc.parsers import sparc_syntax
+from amoco.arch.sparc.parsers import sparc_syntax, sparc_syntax_fast
 from amoco.arch.sparc.formats import SPARC_V8_synthetic
 
 # enforce synthetic syntax and NullFormatter output:
@@ -148,3 +150,50 @@ def test_parser_005():
     s = "ld [%g1], %g1"
     i = sparc_syntax.instr.parseString(s)[0]
     assert str(i) == "ld      [%g1], %g1"
+
+
+def test_parser_006():
+    s = "retl"
+    i = sparc_syntax.instr.parseString(s)[0]
+    assert i.mnemonic == "jmpl"
+    assert str(i) == "retl"
+
+
+def test_parser_007():
+    # only the ",a" suffix is removed (not trailing 'a' of the mnemonic):
+    s = "lda,a [%g1], %o0"
+    i = sparc_syntax.instr.parseString(s, True)[0]
+    assert i.mnemonic == "lda"
+    assert i.misc["annul"] is True
+    assert len(i.operands) == 2
+    assert i.operands[0].size == 32
+    assert i.operands[0].base.ref == "g1"
+    assert i.operands[0].disp == 0
+    assert i.operands[1].ref == "o0"
+
+
+def test_parser_008():
+    s = "mov 0b101, %g1"
+    i = sparc_syntax.instr.parseString(s, True)[0]
+    assert str(i) == "mov     0x5, %g1"
+
+
+@pytest.mark.parametrize(
+    "s",
+    [
+        "nop",
+        "inc 0x42, %g1",
+        "bset   %lo(.LLC1), %g1",
+        "ld [%g1], %g1",
+        "std %o2, [%fp]",
+        "st %g1, [%fp-4]",
+        "sub %sp, (3*4), %sp",
+        "bne,a .L1",
+        "save %sp, -112, %sp  # comment",
+    ],
+)
+def test_parser_fast(s):
+    i = sparc_syntax.instr.parseString(s, True)[0]
+    j = sparc_syntax_fast.parse(s)
+    assert j.mnemonic == i.mnemonic
+    assert str(j) == str(i)
@@ -43,3 +43,11 @@ def test_xdata_select():
     assert op1[0] == 0x41
     assert op1[1] == 624485
     assert op1[2] == 0x0101
+
+
+def test_block_valtype():
+    c = b"\x02\x7f"
+    i = cpu.disassemble(c)
+    assert i.mnemonic == "block"
+    assert i.bytes == c
+    assert str(i.bt) == "#i32"
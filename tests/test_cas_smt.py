@@ -4,10 +4,14 @@ from amoco.cas.smt import has_solver, solver
 from amoco.cas.expressions import reg, mem, slc, cst, complexity
 
 
+@pytest.fixture
+def high_complexity(monkeypatch):
+    """raise conf.Cas.complexity to 100 for the test duration"""
+    monkeypatch.setattr(conf.Cas, "complexity", 100)
+
+
 @pytest.mark.skipif(not has_solver, reason="no smt solver loaded")
-def test_reg_bv(x, y):
-    clx = conf.Cas.complexity
-    conf.Cas.complexity = 100
+def test_reg_bv(x, y, high_complexity):
     xl = slc(x, 0, 8, ref="xl")
     xh = slc(x, 8, 8, ref="xh")
     z = (x ^ cst(0xCAFEBABE, 32)) + (y + (x >> 2))
@@ -19,13 +23,10 @@ def test_reg_bv(x, y):
     assert m.eval(xl.to_smtlib()).as_long() == 0xA
     assert m.eval(xh.to_smtlib()).as_long() == 0x84
     assert ((xv ^ 0xCAFEBABE) + (yv + (xv >> 2))) & 0xFFFFFFFF == 0
-    conf.Cas.complexity = clx
 
 
 @pytest.mark.skipif(not has_solver, reason="no smt solver loaded")
-def test_mem_bv():
-    clx = conf.Cas.complexity
-    conf.Cas.complexity = 100
+def test_mem_bv(high_complexity):
     p = reg("p", 32)
     x = mem(p, 32)
     y = mem(p + 2, 32)
@@ -37,4 +38,3 @@ def test_mem_bv():
     assert m is not None
     assert m(xh) == m(yl)
     assert m(z) == 0
-    conf.Cas.complexity = clx
@@ -1,7 +1,11 @@
+import struct
+
+import pytest
+
 from amoco.system.structs import RawField, VarField, CntField, BitField, BitFieldEx, BindedField
 from amoco.system.structs import (StructDefine, StructCore, UnionDefine,
                                   StructFormatter, TypeDefine, Alltypes,
-                                  StructFactory)
+                                  StructFactory, StructureError)
 
 
 def test_rawfield():
@@ -9,9 +13,31 @@ def test_rawfield():
     assert f.format() == "2I"
     assert f.size() == 8
     assert f.unpack(b"\0\x01\x02\x03AAAA") == (0x03020100, 0x41414141)
+    assert f.unpack(memoryview(b"\0\x01\x02\x03AAAA")) == (0x03020100, 0x41414141)
     assert f.align_value() == 4
 
 
+def test_rawfield_array():
+    f = RawField("H", fcount=40, fname="v", forder=">")
+    data = bytes(range(80))
+    res = f.unpack(data)
+    assert len(res) == 40
+    assert res[0] == 0x0001
+    assert res[39] == 0x4E4F
+    assert res == struct.unpack(">40H", data)
+
+    @StructDefine("""
+    H*40 :> v
+    """)
+    class stru_arr(StructFormatter):
+        pass
+
+    s = stru_arr().unpack(data)
+    assert s.v == struct.unpack(">40H", data)
+    assert "array" not in str(s)
+    assert "(1, 515, 1029" in str(s)
+
+
 def test_rawfieldPtr():
     f = RawField("P", fname="ptr")
     assert f.format() == "P"
@@ -33,6 +59,30 @@ def test_varfield():
     assert f.format() == "7s"
 
 
+def test_varfield_empty():
+    # an immediately terminated value has the same size for every kind of
+    # input data (bytes fast path or per-element decoding):
+    for data in (b"\0abc", memoryview(b"\0abc")):
+        f = VarField("s", fname="string")
+        assert f.unpack(data) == b"\0"
+        assert f.size() == 1
+        assert f.count == 1
+    f = VarField("s", fname="string")
+    f.set_terminate(lambda v, field: v == b"\0")
+    assert f.unpack(b"\0abc") == b"\0"
+    assert f.size() == 1
+    assert f.count == 1
+
+
+def test_varfield_wide():
+    f = VarField("H", fname="wstring")
+    data = struct.pack("<100H", *range(1, 100), 0) + b"AAAA"
+    res = f.unpack(data)
+    assert res == list(range(1, 100)) + [0]
+    assert f.size() == 200
+    assert f.count == 100
+
+
 def test_cntfield():
     f = CntField("s", "~b", fname="bstr")
     assert f.format() == "#s"
@@ -42,6 +92,12 @@ def test_cntfield():
     # updates its size and format
     assert f.size() == 5
     assert f.format() == "b4s"
+    # the size is kept until the field is unpacked or packed again:
+    assert f.size() == 5
+    assert f.unpack(b"\x02abcdefgh") == b"ab"
+    assert f.size() == 3
+    assert f.pack(b"abcdef") == b"\x06abcdef"
+    assert f.size() == 7
 
 
 def test_StructDefine():
@@ -158,6 +214,25 @@ def test_Struct_slop():
     assert s3.pack() == b"\x43\x01\x00\x00\x00"
 
 
+def test_Struct_long():
+    S = StructFactory("SL", "L : a\nI : b")
+    data = bytes(range(16))
+    # with a psize, longs are unpacked as uint32/uint64:
+    s = S().unpack(data, psize=4)
+    assert (s.a, s.b) == (0x03020100, 0x07060504)
+    s = S().unpack(data, psize=8)
+    assert (s.a, s.b) == (0x0706050403020100, 0x0B0A0908)
+    # otherwise a long of native size 8 can't be unpacked with
+    # a standard byte order:
+    if struct.calcsize("L") != struct.calcsize("<L"):
+        with pytest.raises(StructureError):
+            S().unpack(data)
+        with pytest.raises(StructureError):
+            StructFactory("Sl", "l : a\nI : b")().unpack(data)
+        with pytest.raises(StructureError):
+            StructFactory("SL2", "L*2 : a")().unpack(data)
+
+
 def test_Struct_CntFields():
     # we test StructDefine ability to declare CntField:
     @StructDefine(
@@ -225,6 +300,16 @@ def test_bitfield1():
     assert v["d"] == 1
 
 
+def test_bitfield_copy_codec():
+    f = BitField("H", fcount=[2, 4, 1, 1], fname=["a", "b", "c", "d"])
+    g = f.copy()
+    assert g._packfn is f._packfn
+    assert g._unpackfn is f._unpackfn
+    h = BitField("H", fcount=[2, 4, 1, 1], fname=["a", "b", "c", "d"])
+    assert h._unpackfn is f._unpackfn
+    assert g.unpack(b"\x29\x00") == {"a": 1, "b": 10, "c": 0, "d": 0}
+
+
 def test_bitfield2():
     f = BitField("H", fcount=[2, 4, 1, 1], fname=["a", "b", "c", "d"])
     assert f.format() == "H"
@@ -259,6 +344,23 @@ def test_bitfield3():
     assert D["e"] == 34
 
 
+def test_bitfieldex_concat():
+    TypeDefine("int32", "I")
+
+    @StructDefine("""
+    int32 *#4 : a
+    int32 *#4 : b
+    int32 *#24 : c
+    """)
+    class stru_bfx(StructCore):
+        pass
+
+    assert len(stru_bfx.fields) == 1
+    assert stru_bfx.fields[0].subnames == ["a", "b", "c"]
+    s = stru_bfx().unpack(b"\x21\x03\x00\x00")
+    assert (s.a, s.b, s.c) == (1, 2, 3)
+
+
 def test_bitfield_struct():
     TypeDefine("int16", "h")
 
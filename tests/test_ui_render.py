@@ -1,3 +1,5 @@
+from itertools import chain
+
 from amoco.ui import render
 from amoco.ui.graphics.rich_ import rtrow
 
@@ -42,5 +44,23 @@ def test_vltable():
     T.setcolsize(0, c0)
     T.squash_r = True
     T.squash_c = True
-    R = sum((rtrow(r) for r in T.rows),[])
+    R = list(chain.from_iterable(rtrow(r) for r in T.rows))
     assert R[2] == '[literal]abcd[/][register]ebx[/]'
+
+
+def test_vltable_colsize_cache():
+    T = render.vltable(formatter="Null")
+    T.addrow([(render.Token.Literal, "ab")])
+    assert T.getcolsize(0) == 2
+    # rows added directly to the table are still accounted for:
+    T.rows.extend(render.vltable().addrow([(render.Token.Literal, "abcdef")]).rows)
+    assert T.getcolsize(0) == 6
+    T.hiderow(1)
+    assert T.getcolsize(0) == 2
+    assert T.getcolsize(0, squash=False) == 6
+    T.showall()
+    assert T.getcolsize(0) == 6
+    # update() accounts for tokens modified in place:
+    T.rows[0].cols[0].append((render.Token.Literal, "cdefgh"))
+    T.update()
+    assert T.colsize[0] == T.getcolsize(0) == 8